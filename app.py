@@ -1,5 +1,6 @@
 from app import create_app, db
 from app.models import User, Item
+from app.core.utils.log_search import LogSearch
 from werkzeug.security import generate_password_hash
 
 def create_superuser():
@@ -18,11 +19,12 @@ app.config['PERMANENT_SESSION_LIFETIME'] = 1800
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        LogSearch().create_index()
         create_superuser()
         items = Item.query.all()
         if items!= None:
             for item in items:
+                # Keep `active`, the gunicorn workers resume those accounts (see Manager.warm_restart)
                 item.running = False
-                item.active = False
             db.session.commit()
     print("App is starting...")
\ No newline at end of file
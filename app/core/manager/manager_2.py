@@ -1,25 +1,49 @@
-from app.core.sender import SMSSender
-from threading import Thread, Lock
-from app.models import Item
+from threading import Thread, Lock, Event
+from app.models import Item, SenderState
 from app.core.utils.log import LogSender
-from typing import Dict
+from app import db
+from typing import Dict, TYPE_CHECKING
+import json
 import time
 import copy
 
+if TYPE_CHECKING:
+    from app.core.sender import SMSSender
+
 
 class Manager:
+    # Polls every active account. The accounts are started, stopped and edited by requests that may
+    # run in any gunicorn worker, so the manager re-reads them from the database (see __sync__)
+    # instead of being told about each change.
     
-    def __init__(self) -> None:
-        self.senders: Dict[int, SMSSender] = {}
+    def __init__(self, app, interval: int = 10, sync_interval: float = 1, max_catch_up: int = 300) -> None:
+        self.app = app
+        self.senders: Dict[int, 'SMSSender'] = {}
+        self.settings: Dict[int, tuple] = {}
+        self.next_run: Dict[int, float] = {}
+        self.interval = interval # Every sender is checked once per interval
+        self.sync_interval = sync_interval # How often the accounts are re-read from the database
+        self.max_catch_up = max_catch_up # Saved watermarks older than this are ignored, the call history only covers short restarts
         self.running = False
         self.log_sender = LogSender()
         self.queue_thread = None
         self.restarter = None
         self.restart_lock = Lock()
+        self.wakeup = Event()
+        self.last_sync = 0
+
+    def notify(self):
+        # Called after a request changed the accounts so they are picked up right away
+        self.wakeup.set()
+
+    def __settings__(self, item: Item) -> tuple:
+        return (item.name, item.password, item.message, item.did, item.call_duration, item.limit_to_one_DID)
 
-    def add_to_queue(self, item: Item):
+    def __add_sender__(self, item: Item, delay: float = 0, state: SenderState = None):
+        from app.core.sender import SMSSender # Imported on first use, it pulls in pandas and the voipms client
         item = copy.deepcopy(item)
-        self.senders[item.id] = SMSSender(
+        previous = self.senders.get(item.id)
+        sender = SMSSender(
             user_name=item.name,
             password=item.password,
             message=item.message,
@@ -27,23 +51,110 @@ class Manager:
             call_duration=item.call_duration,
             limit_to_one_DID=item.limit_to_one_DID
         )
+        if previous is not None:
+            # Replacing a running sender (e.g. new message), keep its history so nobody is texted twice
+            sender.restore_state(previous.history, previous.watermark)
+        elif state is not None:
+            watermark = state.watermark
+            if watermark is not None and time.time() - watermark > self.max_catch_up:
+                watermark = None
+            sender.restore_state(json.loads(state.history or '[]'), watermark)
+        self.senders[item.id] = sender
+        self.settings[item.id] = self.__settings__(item)
+        if previous is None:
+            self.next_run[item.id] = time.time() + delay
 
-        if not self.running:
-            self.__start_queue__()
-        self.log_sender.send_log([item.name, time.time(), 'Started'])
+    def __remove_sender__(self, key):
+        self.senders.pop(key, None)
+        self.settings.pop(key, None)
+        self.next_run.pop(key, None)
+
+    def __sync__(self):
+        # Starts the accounts that became active, stops the ones that were stopped or deleted and
+        # rebuilds the ones whose settings changed
+        with self.app.app_context():
+            items = Item.query.filter_by(active=True).order_by(Item.id).all()
+            active = {item.id: item for item in items}
+
+            stopped = [key for key in self.senders if key not in active]
+            stopped_names = [self.senders[key].email for key in stopped]
+            for key in stopped:
+                self.__remove_sender__(key)
+            if stopped:
+                # A stopped account starts fresh next time, its old state would only be stale
+                SenderState.query.filter(SenderState.item_id.in_(stopped)).delete(synchronize_session=False)
+
+            started = [item for item in items if item.id not in self.senders]
+            changed = [item for item in items if item.id in self.senders and self.settings[item.id] != self.__settings__(item)]
+            if started:
+                states = {state.item_id: state for state in SenderState.query.filter(SenderState.item_id.in_([item.id for item in started])).all()}
+                for index, item in enumerate(started):
+                    # Spread the first checks evenly across the interval instead of all in the same second
+                    self.__add_sender__(item, delay=index * self.interval / len(started), state=states.get(item.id))
+            for item in changed:
+                self.__add_sender__(item)
+
+            started_names = [item.name for item in started]
+            changed_names = [item.name for item in changed]
+
+            # `running` is what the dashboard shows, only this worker knows it
+            for item in Item.query.filter(Item.running != Item.active).all():
+                item.running = item.active
+            db.session.commit()
+
+        if started_names:
+            self.log_sender.send_log(['System', time.time(), 'Started: ' + ', '.join(started_names)])
+        if changed_names:
+            self.log_sender.send_log(['System', time.time(), 'Updated: ' + ', '.join(changed_names)])
+        if stopped:
+            self.log_sender.send_log(['System', time.time(), 'Stopped: ' + ', '.join(stopped_names)])
+
+    def warm_restart(self):
+        # Resumes the accounts that were active before the restart, the first sync starts them with their saved state
+        self.__start_queue__()
+        self.log_sender.send_log(['System', time.time(), 'Warm restart, resuming the active accounts'])
+
+    def __save_state__(self, keys):
+        # Persist dedup history and watermark so a restart neither misses nor double texts calls
+        try:
+            with self.app.app_context():
+                for key in keys:
+                    sender = self.senders.get(key)
+                    if sender is None:
+                        continue
+                    state = sender.get_state()
+                    db.session.merge(SenderState(item_id=key, history=json.dumps(state['history']), watermark=state['watermark']))
+                db.session.commit()
+        except Exception as e:
+            self.log_sender.send_log(['Thread', time.time(), f'Saving sender state failed: {e}'])
 
     def __run_queue__(self):
         try:
             self.log_sender.send_log(['Thread', time.time(), 'Started'])
             loop_time = time.time()
-            while self.senders and self.running:
-                start_time = time.time()
+            while self.running:
+                if self.wakeup.is_set() or time.time() - self.last_sync >= self.sync_interval:
+                    self.wakeup.clear()
+                    self.last_sync = time.time()
+                    try:
+                        self.__sync__()
+                    except Exception as e:
+                        self.log_sender.send_log(['Thread', time.time(), f'Reading the accounts failed: {e}'])
+
+                checked = []
                 for key in list(self.senders.keys()):
-                    self.senders[key].run()
-                
-                elapsed_time = time.time() - start_time
-                if elapsed_time < 10: # Will run it every 10 seconds
-                    time.sleep(10 - elapsed_time)
+                    sender = self.senders.get(key)
+                    next_run = self.next_run.get(key, 0)
+                    if sender is None or next_run > time.time():
+                        continue
+                    sender.run()
+                    self.next_run[key] = max(next_run + self.interval, time.time())
+                    checked.append(key)
+                self.__save_state__(checked)
+
+                # Sleep until the next sender is due or the next sync, every sender keeps its own offset within the interval
+                next_due = min(list(self.next_run.values()) + [self.last_sync + self.sync_interval])
+                self.wakeup.wait(min(max(next_due - time.time(), 0.1), self.interval))
 
                 if time.time() - loop_time > 3600*6: # Will restart the thread every 1h
                     self.__start_restarter_thread__()
@@ -64,18 +175,11 @@ class Manager:
 
     def __stop_queue__(self):
         self.running = False
+        self.wakeup.set()
         if hasattr(self, 'queue_thread') and self.queue_thread.is_alive():
             self.queue_thread.join()
         self.log_sender.send_log(['Queue', time.time(), 'Queue thread stopped'])
 
-    def stop(self, item: Item):
-        if item.name in self.senders:
-            del self.senders[item.id]
-            self.log_sender.send_log(['System', time.time(), str(item.name)])
-            if not self.senders:
-                self.__stop_queue__()
-        self.log_sender.send_log([item.name, time.time(), 'Stopped'])
-
     def __restart_queue_thread__(self):
         self.__stop_queue__()
         time.sleep(1)
@@ -27,6 +27,7 @@ class SMSSender:
         self.logger = LogSender()
         self.dls = DayLightSaving()
         self.limit_to_one_DID = limit_to_one_DID
+        self.watermark = None # Epoch of the last successful check, lets a resumed sender catch up on the calls it missed while down
 
     def auth(self) -> None:
         #Authenticate the client with Voip.ms API
@@ -42,10 +43,11 @@ class SMSSender:
         
         except VoipException as ve:
             #if the expection is no call history it will not log it.
-            if not('There are no CDR entries for the filter' in str(ve)):
-                self.log(f"VoipException occurred: {ve}")
+            if 'There are no CDR entries for the filter' in str(ve):
+                return pd.DataFrame([])
+            self.log(f"VoipException occurred: {ve}")
 
-        return pd.DataFrame([])
+        return None
 
     def extract_value_between_tags(self,text):
         pattern = r'<(.*?)>'
@@ -89,7 +91,18 @@ class SMSSender:
         
     def within_last_min(self,last_record_time:int):
         last_min = 60*self.delayed_minutes # Voip.ms sometimes takes time to register the call so I'm checking last 3 mins instead of the last minute
-        return int(time()) - last_record_time < last_min
+        since = int(time())
+        if self.watermark is not None:
+            since = min(since, self.watermark) # After a restart also check the calls since the last successful check
+        return since - last_record_time < last_min
+
+    def get_state(self) -> dict:
+        return {'history': [list(history_item) for history_item in self.history], 'watermark': self.watermark}
+
+    def restore_state(self, history:list, watermark:int) -> None:
+        # History items are [caller_id, epoch], they have to be lists again for the `in` check in run_check
+        self.history.extend([list(history_item) for history_item in history])
+        self.watermark = watermark
 
     def log(self,log_item):
         if self.log_it:
@@ -102,6 +115,8 @@ class SMSSender:
         if not(records.empty):
             records = self.filter_inbound(records)
             records = self.filter_missed(records)
+            # Oldest first so the newest calls are the ones left in the history when a catch-up fills it
+            records = records.sort_values('date').reset_index(drop=True)
             for index, record in records.iterrows():
                 last_record_time = self.datetime_to_epoch(record['date'])
                 if self.within_last_min(last_record_time):
@@ -140,11 +155,15 @@ class SMSSender:
                         'busy':1,
                         'failed':1}
             
+            checked_at = int(time())
             self.auth()
 
             records = self.get_history(params)
+            if records is None:
+                return
             if not(records.empty):
                 self.run_check(records)
+            self.watermark = checked_at
         except:
             self.log(f"RunFailed: {self.email} called at {int(time())}")
 
@@ -1,5 +1,4 @@
 from datetime import datetime
-import pytz
 
 class DayLightSaving:
 
@@ -7,6 +6,7 @@ class DayLightSaving:
         pass
 
     def is_dst_in_toronto(self):
+        import pytz # Imported on first use to keep it off the web workers' start up
         toronto_tz = pytz.timezone('America/Toronto')
         toronto_time = datetime.now(toronto_tz)
         return bool(toronto_time.dst())
\ No newline at end of file
@@ -1,11 +1,11 @@
 from datetime import datetime, timezone, timedelta
-from pytz import timezone as tz
 
 class EpochToDateTime:
     def __init__(self) -> None:
         pass
         
     def epoch_to_datetime(self, epoch_time):
+        from pytz import timezone as tz # Imported on first use to keep it off the web workers' start up
         # Convert epoch time to datetime
         eastern = tz('America/Toronto')
         dt_object = datetime.fromtimestamp(epoch_time, tz=eastern)
@@ -0,0 +1,125 @@
+from app.models import Item
+from app import db
+import json
+import csv
+import io
+
+
+class ItemImport:
+    # Creates or updates many accounts in one transaction from CSV or JSON rows.
+    # A row with an `id` updates that account, otherwise the account with the same
+    # name and DID is updated (just the same name when the row has no DID and the name
+    # is unique), otherwise a new account is created.
+    fields = ['name', 'password', 'message', 'did', 'call_duration', 'limit_to_one_DID']
+    required = ['name', 'password', 'message', 'call_duration']
+
+    def __init__(self) -> None:
+        pass
+
+    def read_csv(self, text: str) -> list:
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def read_json(self, data) -> list:
+        if isinstance(data, (str, bytes)):
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Invalid JSON: {e}')
+        if isinstance(data, dict):
+            data = data.get('items')
+        if not isinstance(data, list):
+            raise ValueError('Expected a list of accounts or {"items": [...]}')
+        return data
+
+    def to_bool(self, value) -> bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+    def to_values(self, row, row_number: int) -> dict:
+        # Only the fields that are in the row (and not empty) are set, so an update can change just the message
+        if not isinstance(row, dict):
+            raise ValueError(f'Row {row_number}: expected an object')
+        values = {}
+        for field in self.fields:
+            value = row.get(field)
+            if value is None or (isinstance(value, str) and value.strip() == ''):
+                continue
+            if field == 'call_duration':
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f'Row {row_number}: call_duration must be a number')
+            elif field == 'limit_to_one_DID':
+                value = self.to_bool(value)
+            else:
+                # bool is an int too, but str(True) is not a name/DID anyone meant
+                if isinstance(value, bool) or not isinstance(value, (str, int)):
+                    raise ValueError(f'Row {row_number}: {field} must be text')
+                value = str(value).strip() if field != 'message' else str(value)
+            values[field] = value
+        return values
+
+    def apply(self, rows: list) -> dict:
+        if not rows:
+            raise ValueError('No accounts to import')
+
+        items = Item.query.all()
+        by_id = {item.id: item for item in items}
+        by_name_did = {(item.name, item.did): item for item in items}
+        by_name = {}
+        for item in items:
+            by_name.setdefault(item.name, []).append(item)
+
+        # Validate every row before touching the session so a bad row leaves nothing half imported
+        changes = []
+        pending = {} # New accounts by (name, did), a repeated row updates the one created above
+        for row_number, row in enumerate(rows, start=1):
+            values = self.to_values(row, row_number)
+            item = None
+            if isinstance(row, dict) and str(row.get('id') or '').strip():
+                try:
+                    item = by_id.get(int(row['id']))
+                except (TypeError, ValueError):
+                    raise ValueError(f'Row {row_number}: id must be a number')
+                if item is None:
+                    raise ValueError(f'Row {row_number}: account {row["id"]} does not exist')
+            elif 'name' in values and 'did' in values:
+                key = (values['name'], values['did'])
+                if key in pending:
+                    pending[key].update(values)
+                    continue
+                item = by_name_did.get(key)
+            elif 'name' in values:
+                # No DID in the row, the name alone has to point to one account
+                name = values['name']
+                pending_keys = [key for key in pending if key[0] == name]
+                matches = by_name.get(name, [])
+                if len(pending_keys) + len(matches) > 1:
+                    raise ValueError(f'Row {row_number}: more than one account is named {name}, add the did or id column')
+                if pending_keys:
+                    pending[pending_keys[0]].update(values)
+                    continue
+                item = matches[0] if matches else None
+
+            if item is None:
+                missing = [field for field in self.required if field not in values]
+                if missing:
+                    raise ValueError(f'Row {row_number}: missing {", ".join(missing)}')
+                pending[(values['name'], values.get('did'))] = values
+            changes.append((item, values))
+
+        created, updated = [], []
+        for item, values in changes:
+            if item is None:
+                item = Item(**{'running': False, 'active': False, 'limit_to_one_DID': False, **values})
+                db.session.add(item)
+                created.append(item)
+            else:
+                for field, value in values.items():
+                    setattr(item, field, value)
+                if item not in updated:
+                    updated.append(item)
+        db.session.commit()
+
+        return {'created': created, 'updated': updated}
@@ -8,7 +8,7 @@ class LogSender:
 
     def send_log(self, data:list):
         try:
-            response = requests.post(self.log_endpoint, json={'data': data+[Config.LOG_TOKEN]})
+            response = requests.post(self.log_endpoint, json={'data': data+[Config.LOG_TOKEN]}, timeout=5) # A busy server must not block the polling thread
             if response.status_code == 200:
                 pass
             else:
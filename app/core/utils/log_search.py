@@ -0,0 +1,99 @@
+from sqlalchemy import text
+from app import db
+import re
+
+
+class LogSearch:
+    # External content FTS5 index over Log.record/Log.company. The log table stays
+    # the source of truth, triggers keep the index in sync on every insert/update/delete.
+    index_table = 'log_fts'
+    log_table = 'log'
+    max_per_page = 200
+
+    def __init__(self) -> None:
+        pass
+
+    def create_index(self) -> None:
+        # Safe to call on every start, backfills the index the first time it is created
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {'name': self.index_table}).first()
+
+        statements = [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {self.index_table} USING fts5(
+                record, company,
+                content='{self.log_table}', content_rowid='id',
+                prefix='2 3')""",
+            f"""CREATE TRIGGER IF NOT EXISTS {self.index_table}_ai AFTER INSERT ON {self.log_table} BEGIN
+                INSERT INTO {self.index_table}(rowid, record, company) VALUES (new.id, new.record, new.company);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {self.index_table}_ad AFTER DELETE ON {self.log_table} BEGIN
+                INSERT INTO {self.index_table}({self.index_table}, rowid, record, company) VALUES ('delete', old.id, old.record, old.company);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {self.index_table}_au AFTER UPDATE ON {self.log_table} BEGIN
+                INSERT INTO {self.index_table}({self.index_table}, rowid, record, company) VALUES ('delete', old.id, old.record, old.company);
+                INSERT INTO {self.index_table}(rowid, record, company) VALUES (new.id, new.record, new.company);
+            END""",
+        ]
+        for statement in statements:
+            db.session.execute(text(statement))
+
+        if not exists:
+            # Index the rows that were logged before the index existed
+            db.session.execute(text(f"INSERT INTO {self.index_table}({self.index_table}) VALUES ('rebuild')"))
+        db.session.commit()
+
+    def build_match_query(self, query: str) -> str:
+        # Turns user input into a safe FTS5 expression:
+        #   "sms sent"  -> phrase match
+        #   43147*      -> prefix match
+        #   everything else is matched as a plain term, all terms must match
+        terms = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+            if phrase.strip():
+                terms.append('"' + phrase.strip() + '"')
+            elif word:
+                prefix = word.endswith('*')
+                word = word.rstrip('*').replace('"', '""')
+                if word:
+                    terms.append('"' + word + '"' + ('*' if prefix else ''))
+        return ' '.join(terms)
+
+    def search(self, query: str, company: str = None, since: str = None, until: str = None, page: int = 1, per_page: int = 50) -> dict:
+        match = self.build_match_query(query or '')
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), self.max_per_page)
+
+        if not match:
+            return {'results': [], 'page': page, 'per_page': per_page, 'has_more': False}
+
+        # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS' so they compare correctly as strings
+        filters = ''
+        params = {'match': match, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+        if company:
+            filters += ' AND log.company = :company'
+            params['company'] = company
+        if since:
+            filters += ' AND log.timestamp >= :since'
+            params['since'] = since
+        if until:
+            filters += ' AND log.timestamp <= :until'
+            params['until'] = until
+
+        rows = db.session.execute(text(
+            f"""SELECT log.id, log.timestamp, log.company, log.record
+                FROM {self.index_table}
+                JOIN {self.log_table} AS log ON log.id = {self.index_table}.rowid
+                WHERE {self.index_table} MATCH :match{filters}
+                ORDER BY {self.index_table}.rowid DESC
+                LIMIT :limit OFFSET :offset"""), params).all()
+
+        return {
+            'results': [
+                {'id': row.id, 'timestamp': row.timestamp, 'company': row.company, 'record': row.record}
+                for row in rows[:per_page]
+            ],
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(rows) > per_page,
+        }
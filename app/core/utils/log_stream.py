@@ -0,0 +1,149 @@
+from threading import Thread, Lock, Condition, Event
+from collections import deque
+from app.models import Log
+from time import time
+import json
+
+
+class LogSubscriber:
+    def __init__(self, company: str = None, backlog_size: int = 200) -> None:
+        self.company = company
+        self.backlog = deque([], maxlen=backlog_size) # A slow client loses its oldest entries instead of growing the buffer
+        self.dropped = 0
+        self.condition = Condition()
+
+    def push(self, entries: list) -> None:
+        with self.condition:
+            for entry in entries:
+                if self.company and entry['company'] != self.company:
+                    continue
+                if len(self.backlog) == self.backlog.maxlen:
+                    self.dropped += 1
+                self.backlog.append(entry)
+            self.condition.notify()
+
+    def pop_all(self, timeout: float):
+        with self.condition:
+            if not self.backlog:
+                self.condition.wait(timeout)
+            entries = list(self.backlog)
+            dropped = self.dropped
+            self.backlog.clear()
+            self.dropped = 0
+        return entries, dropped
+
+
+class LogStream:
+    # Fans new Log rows out to every connected Server-Sent Events client. A single follower
+    # thread per worker reads the rows after the last id it has seen (only while someone is
+    # watching), so the database load does not grow with the number of clients. Logs posted to
+    # this worker wake it up right away, logs posted to the other workers show up within poll_interval.
+    # Every open stream holds a gunicorn thread, so there are at most max_clients per worker (below the
+    # --threads in run.sh) and each stream ends after max_duration, the browser reconnects on its own.
+
+    def __init__(self, buffer_size: int = 1000, backlog_size: int = 200, poll_interval: float = 1, heartbeat: float = 15, max_clients: int = 8, max_duration: float = 300) -> None:
+        self.buffer = deque([], maxlen=buffer_size) # Recent entries, used to resume from Last-Event-ID
+        self.backlog_size = backlog_size
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.max_duration = max_duration
+        self.clients = 0
+        self.subscribers = set()
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.last_id = 0
+        self.follower = None
+        self.app = None
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    def reserve(self) -> bool:
+        # Takes one of the max_clients slots, release() gives it back when the response is closed
+        with self.lock:
+            if self.clients >= self.max_clients:
+                return False
+            self.clients += 1
+            return True
+
+    def release(self) -> None:
+        with self.lock:
+            self.clients = max(self.clients - 1, 0)
+
+    def to_entry(self, log: Log) -> dict:
+        return {'id': log.id, 'timestamp': log.timestamp, 'company': log.company, 'record': log.record}
+
+    def subscribe(self, app, company: str = None, last_event_id: int = None) -> LogSubscriber:
+        subscriber = LogSubscriber(company=company, backlog_size=self.backlog_size)
+        with self.lock:
+            self.app = app
+            if self.follower is None:
+                # Fresh start, the buffer may have a gap since the last follower stopped
+                with app.app_context():
+                    self.last_id = Log.query.with_entities(Log.id).order_by(Log.id.desc()).limit(1).scalar() or 0
+                self.buffer.clear()
+                self.follower = Thread(target=self.__follow__, daemon=True)
+                self.follower.start()
+
+            if last_event_id is not None and last_event_id < self.last_id:
+                if self.buffer and self.buffer[0]['id'] <= last_event_id + 1:
+                    missed = [entry for entry in self.buffer if entry['id'] > last_event_id]
+                else:
+                    # Older than the buffer, read the latest entries the client missed once
+                    with app.app_context():
+                        query = Log.query.filter(Log.id > last_event_id, Log.id <= self.last_id)
+                        if company:
+                            query = query.filter(Log.company == company)
+                        missed = [self.to_entry(log) for log in reversed(query.order_by(Log.id.desc()).limit(self.backlog_size).all())]
+                subscriber.push(missed)
+
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LogSubscriber) -> None:
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, entries: list) -> None:
+        with self.lock:
+            self.buffer.extend(entries)
+            self.last_id = entries[-1]['id']
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.push(entries)
+
+    def __follow__(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.follower = None
+                    return
+                last_id = self.last_id
+            try:
+                with self.app.app_context():
+                    entries = [self.to_entry(log) for log in Log.query.filter(Log.id > last_id).order_by(Log.id).limit(500).all()]
+                if entries:
+                    self.publish(entries)
+                    continue
+            except Exception as e:
+                print(f"An error occurred while following the logs: {e}")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def events(self, app, company: str = None, last_event_id: int = None):
+        # Generator for the streaming response, the client is unsubscribed when it disconnects
+        subscriber = self.subscribe(app, company=company, last_event_id=last_event_id)
+        ends_at = time() + self.max_duration
+        try:
+            yield 'retry: 3000\n\n'
+            while time() < ends_at:
+                entries, dropped = subscriber.pop_all(min(self.heartbeat, max(ends_at - time(), 0)))
+                if dropped:
+                    yield f'event: dropped\ndata: {json.dumps({"count": dropped})}\n\n'
+                if not entries:
+                    yield ': keep-alive\n\n'
+                for entry in entries:
+                    yield f'id: {entry["id"]}\nevent: log\ndata: {json.dumps(entry)}\n\n'
+        finally:
+            self.unsubscribe(subscriber)
@@ -25,4 +25,10 @@ class Log(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     company = db.Column(db.String(100))
     timestamp = db.Column(db.String(50))
-    record = db.Column(db.Text)
\ No newline at end of file
+    record = db.Column(db.Text)
+
+# Dedup history and watermark of a running SMSSender, used to resume it after a restart
+class SenderState(db.Model):
+    item_id = db.Column(db.Integer, db.ForeignKey('item.id'), primary_key=True)
+    history = db.Column(db.Text)
+    watermark = db.Column(db.Integer)
@@ -1,32 +1,83 @@
-from flask import Flask, render_template, request, redirect, url_for, session, Blueprint, jsonify, Response
+from flask import Flask, render_template, request, redirect, url_for, session, Blueprint, jsonify, Response, current_app
 from werkzeug.security import check_password_hash, generate_password_hash
-from app.core.manager.manager_2 import Manager
+from sqlalchemy.exc import OperationalError
 from app.core.utils.dls import DayLightSaving
 from app.core.utils.epoch_to_dt import EpochToDateTime
-from app.models import Item, User,Log
+from app.core.utils.log_search import LogSearch
+from app.core.utils.log_stream import LogStream
+from app.core.utils.item_import import ItemImport
+from app.models import Item, User,Log, SenderState
 from app.config import Config
 from functools import wraps
+from threading import Thread, Lock
+import fcntl
+import os
 from . import db
 bp = Blueprint('main', __name__)
 
-thread_manager = Manager()
+thread_manager = None
+thread_manager_lock_file = None
 dls = DayLightSaving()
 epoch_to_datetime = EpochToDateTime()
+log_search = LogSearch()
+log_stream = LogStream()
+item_import = ItemImport()
 
 
-request_queue = []
+def start_thread_manager(app):
+    # Only the gunicorn worker that gets the lock polls, otherwise every worker would text the same
+    # callers. The others never build the manager or import the polling stack (sender, voipms, pandas)
+    # unless the polling worker exits, then one of them takes over.
+    os.makedirs(app.instance_path, exist_ok=True)
+    lock_file = open(os.path.join(app.instance_path, 'warm_restart.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        # A graceful reload (kill -HUP) starts the new workers while the old polling worker is still
+        # shutting down, so keep waiting for the lock instead of giving up on polling
+        Thread(target=wait_for_thread_manager_lock, args=(app, lock_file), daemon=True).start()
+        return None
+    return build_thread_manager(app, lock_file)
+
+
+def wait_for_thread_manager_lock(app, lock_file):
+    fcntl.flock(lock_file, fcntl.LOCK_EX) # Blocks until the polling worker exits
+    print(f"Worker {os.getpid()} got the warm restart lock, taking over polling")
+    build_thread_manager(app, lock_file)
+
+
+def build_thread_manager(app, lock_file):
+    global thread_manager, thread_manager_lock_file
+    thread_manager_lock_file = lock_file # Held for the life of the worker
+
+    # The polling worker also creates the search index, so starting with just `gunicorn wsgi:app` works
+    try:
+        with app.app_context():
+            log_search.create_index()
+    except Exception as e:
+        print(f"An error occurred while creating the log search index: {e}")
+
+    from app.core.manager.manager_2 import Manager
+    thread_manager = Manager(app)
+    thread_manager.warm_restart()
+    return thread_manager
+
+
+def notify_thread_manager():
+    # Requests only change the accounts in the database, the polling worker re-reads them every
+    # second. This makes it happen right away when that worker handled the request.
+    if thread_manager is not None:
+        thread_manager.notify()
+
+
+database_lock = Lock()
 
 def queue_database_modification(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Add incoming request to the queue
-        request_queue.append((func, args, kwargs))
-        # Process all requests in the queue one at a time
-        for queued_func, queued_args, queued_kwargs in request_queue:
-            result = queued_func(*queued_args, **queued_kwargs)
-        # Clear the queue after processing
-        request_queue.clear()
-        return result  # Return the result of the wrapped function
+        # Process the requests one at a time, gunicorn runs several threads per worker
+        with database_lock:
+            return func(*args, **kwargs)
     return wrapper
 
 
@@ -98,7 +149,6 @@ def create_item():
 def edit_item(item_id):
     if 'user_id' in session:
         item = Item.query.get_or_404(item_id)
-        thread_manager.stop(item)
         if request.method == 'POST':
             item.name = request.form['new_item_name']
             item.password = request.form['new_password']
@@ -109,6 +159,7 @@ def edit_item(item_id):
             item.active = False
             item.running = False
             db.session.commit()
+            notify_thread_manager()
             return redirect(url_for('main.dashboard'))
 
         return render_template('edit.html', item=item)
@@ -127,31 +178,102 @@ def run_item(item_id):
     if request.method == 'POST' and not item.active:
         item.active = True
         item.running = True
-        thread_manager.add_to_queue(item)
     else:
         item.active = False
         item.running = False
-        thread_manager.stop(item)
-
 
     db.session.commit()
+    notify_thread_manager()
     return redirect(url_for('main.dashboard'))
 
+
+@bp.route('/items/import/', methods=['POST'])
+@queue_database_modification
+def import_items():
+    # Creates or updates many accounts in one transaction from an uploaded CSV/JSON file or a JSON body
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    try:
+        if 'file' in request.files:
+            file = request.files['file']
+            text = file.read().decode('utf-8-sig')
+            if file.filename.lower().endswith('.json'):
+                rows = item_import.read_json(text)
+            else:
+                rows = item_import.read_csv(text)
+        else:
+            rows = item_import.read_json(request.get_json(silent=True))
+        result = item_import.apply(rows)
+    except (ValueError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
+    # Running accounts are rebuilt with their new settings by the polling worker
+    notify_thread_manager()
+
+    return jsonify({
+        'created': [item.id for item in result['created']],
+        'updated': [item.id for item in result['updated']],
+    }), 200
+
+
+@bp.route('/items/run/', methods=['POST'])
+@queue_database_modification
+def run_items():
+    # Starts or stops many accounts with one manager call: {"action": "start"|"stop", "ids": [1, 2, 3]}
+    if 'user_id' not in session:
+        return redirect(url_for('main.login'))
+
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {'action': request.form.get('action'), 'ids': request.form.getlist('ids')}
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected {"action": "start"|"stop", "ids": [...]}'}), 400
+    action = data.get('action')
+    try:
+        ids = data.get('ids') or []
+        if not isinstance(ids, list):
+            raise TypeError # A string or object would be iterated character by character / key by key
+        ids = [int(item_id) for item_id in ids]
+    except (TypeError, ValueError):
+        return jsonify({'message': 'ids must be a list of numbers'}), 400
+    if action not in ('start', 'stop'):
+        return jsonify({'message': 'action must be start or stop'}), 400
+
+    # Only the accounts that change are returned, so callers can tell which ones were already started/stopped
+    items = Item.query.filter(Item.id.in_(ids)).all()
+    if action == 'start':
+        items = [item for item in items if not item.active]
+        for item in items:
+            item.active = True
+            item.running = True
+    else:
+        items = [item for item in items if item.active]
+        for item in items:
+            item.active = False
+            item.running = False
+
+    db.session.commit()
+    notify_thread_manager()
+    return jsonify({'action': action, 'ids': [item.id for item in items]}), 200
+
     
 @bp.route('/delete/<string:item_id>', methods=['POST'])
 @queue_database_modification
 def delete_item(item_id):
     if 'user_id' in session:
         item = Item.query.get_or_404(item_id)
-        thread_manager.stop(item)
+        SenderState.query.filter_by(item_id=item.id).delete()
         db.session.delete(item)
         db.session.commit()
+        notify_thread_manager()
         return redirect(url_for('main.dashboard'))
     else:
         return redirect(url_for('main.login'))
 
+# Not queued, the manager posts logs here while run_item/edit_item/delete_item hold the queue
 @bp.route('/log/', methods=['POST','GET'])
-@queue_database_modification
 def log_item():
     if request.method == 'POST':
         data = request.get_json().get('data')
@@ -164,6 +286,7 @@ def log_item():
 
             db.session.add(new_log)
             db.session.commit()
+            log_stream.notify()
             return jsonify({'message': 'Log added successfully'}), 200
         else:    
             return redirect(url_for('main.login'))
@@ -174,6 +297,52 @@ def log_item():
             return render_template('logs.html', log_items = log_items)
         else:    
             return redirect(url_for('main.login'))
+
+@bp.route('/log/search/', methods=['GET'])
+def search_logs():
+    # Full-text search over the log records, e.g. /log/search/?q="SMS Sent" 4314*&company=...
+    if 'user_id' in session:
+        try:
+            results = log_search.search(
+                query=request.args.get('q', ''),
+                company=request.args.get('company'),
+                since=request.args.get('since'),
+                until=request.args.get('until'),
+                page=request.args.get('page', 1, type=int),
+                per_page=request.args.get('per_page', 50, type=int),
+            )
+        except OperationalError:
+            # The index is created by the polling worker when it starts
+            db.session.rollback()
+            return jsonify({'message': 'The log search index is not ready yet, try again later'}), 503
+        return jsonify(results), 200
+    else:
+        return redirect(url_for('main.login'))
+
+@bp.route('/log/stream/', methods=['GET'])
+def stream_logs():
+    # Server-Sent Events, browsers send Last-Event-ID on reconnect, the page passes last_event_id on first connect
+    if 'user_id' in session:
+        if not log_stream.reserve():
+            response = jsonify({'message': 'Too many live log viewers, try again later'})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        if last_event_id is None:
+            last_event_id = request.args.get('last_event_id', type=int)
+
+        response = Response(log_stream.events(
+            current_app._get_current_object(),
+            company=request.args.get('company') or None,
+            last_event_id=last_event_id,
+        ), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no' # Nginx would buffer the stream otherwise
+        response.call_on_close(log_stream.release)
+        return response
+    else:
+        return redirect(url_for('main.login'))
         
 def export(log_items):
     # Create a CSV response
@@ -25,4 +25,27 @@ function disablePage() {
       });
     });
   });
-  
\ No newline at end of file
+  
+  function streamLogs(url) {
+    // Prepends the new log entries pushed by /log/stream/ to the logs table
+    var tableBody = document.querySelector("#logs tbody");
+    var source = new EventSource(url);
+
+    source.addEventListener("log", function (event) {
+      var log = JSON.parse(event.data);
+      var row = document.createElement("tr");
+      var timestamp = document.createElement("td");
+      var company = document.createElement("td");
+      var companyName = document.createElement("strong");
+      var record = document.createElement("td");
+
+      timestamp.textContent = log.timestamp;
+      companyName.textContent = log.company;
+      record.textContent = log.record;
+      company.appendChild(companyName);
+      row.appendChild(timestamp);
+      row.appendChild(company);
+      row.appendChild(record);
+      tableBody.insertBefore(row, tableBody.firstChild);
+    });
+  }
@@ -0,0 +1,67 @@
+# Measures what a gunicorn worker pays before serving its first request: the create_app() time
+# and the resident memory afterwards. Every run is a fresh interpreter so nothing is cached.
+#
+#   python benchmarks/startup.py            # current tree
+#   python benchmarks/startup.py --eager    # also import the polling stack, like app.routes used to
+#
+# Run it from the repository root, it needs app/config.py (created by setup.sh).
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+if %(eager)r:
+    import app.core.manager.manager_2, app.core.sender, app.core.utils.dls, app.core.utils.epoch_to_dt, pytz
+elapsed = time.perf_counter() - started
+
+rss = 0
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss = int(line.split()[1]) # kB
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_kb': rss,
+    'polling_stack': 'app.core.sender' in sys.modules,
+    'pandas': 'pandas' in sys.modules,
+}))
+"""
+
+
+def measure(eager: bool) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', WORKER % {'eager': eager}],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONPATH': ROOT},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='create_app() start up time and per-worker RSS')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--eager', action='store_true', help='import the polling stack too (the old behaviour)')
+    args = parser.parse_args()
+
+    measure(args.eager) # Warm the OS file cache and .pyc files
+    results = [measure(args.eager) for _ in range(args.runs)]
+    seconds = sorted(result['seconds'] for result in results)
+    rss = sorted(result['rss_kb'] for result in results)
+
+    print(f"mode:          {'eager' if args.eager else 'lazy'} ({args.runs} runs)")
+    print(f"create_app():  median {seconds[len(seconds) // 2] * 1000:.1f} ms, min {seconds[0] * 1000:.1f} ms")
+    print(f"worker RSS:    median {rss[len(rss) // 2] / 1024:.1f} MB")
+    print(f"polling stack: {'imported' if results[0]['polling_stack'] else 'not imported'}, "
+          f"pandas {'imported' if results[0]['pandas'] else 'not imported'}")
+
+
+if __name__ == '__main__':
+    main()
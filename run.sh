@@ -8,4 +8,5 @@ python3 app.py
 
 # Start the server
 # If you are changing the port you have to change it in the setup.sh and in the log.py as well
-gunicorn -w 4 -b 127.0.0.1:8000 wsgi:app
\ No newline at end of file
+# Threads so the live log streams (/log/stream/) don't hold a whole worker each
+gunicorn -w 4 -k gthread --threads 16 -b 127.0.0.1:8000 wsgi:app
\ No newline at end of file
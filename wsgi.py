@@ -1,7 +1,9 @@
 from app import create_app
+from app.routes import start_thread_manager
 
 app = create_app()
 app.config['PERMANENT_SESSION_LIFETIME'] = 1800
+start_thread_manager(app)
 
 if __name__ == '__main__':
     app.run(debug=False)